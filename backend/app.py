@@ -3,27 +3,70 @@ Flask Backend Server for Water Quality Monitoring System
 Handles MQTT data from Wokwi, ML predictions, and email alerts
 """
 
-from flask import Flask, render_template, request, jsonify
+# gevent must patch the standard library before anything else is imported
+from gevent import monkey
+monkey.patch_all()
+
+from flask import Flask, Response, render_template, request, jsonify
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 import joblib
 import numpy as np
 from pathlib import Path
-import json
+import orjson
 from datetime import datetime
 import paho.mqtt.client as mqtt
 import threading
-from pymongo import MongoClient
+import collections
+import atexit
+import queue
+import time
+import functools
+import warnings
+import logging
+import logging.handlers
+from dataclasses import dataclass
+from pymongo import MongoClient, DESCENDING
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
 
 # Import custom modules
 from email_service import EmailAlertService
 import config
 
+# Buffered logging: records are held in memory and written out in bursts,
+# immediately once a record at LOG_FLUSH_LEVEL or above arrives, otherwise
+# every LOG_FLUSH_INTERVAL seconds (see _log_flusher).
+# Per-reading messages are DEBUG, so they cost nothing at the default INFO level.
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+_log_buffer = logging.handlers.MemoryHandler(
+    config.LOG_BUFFER_CAPACITY,
+    flushLevel=logging.getLevelName(config.LOG_FLUSH_LEVEL),
+    target=_log_stream
+)
+logging.basicConfig(level=config.LOG_LEVEL, handlers=[_log_buffer])
+log = logging.getLogger(__name__)
+
 # Initialize Flask app
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 app.config['SECRET_KEY'] = 'water_quality_secret_key_2025'
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*", ping_interval=config.WEBSOCKET_PING_INTERVAL, async_mode='threading')
+
+class OrjsonWrapper:
+    """json-module stand-in for Socket.IO packets, backed by orjson (serializes datetimes natively)"""
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return orjson.dumps(obj).decode()
+    
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+
+socketio = SocketIO(app, cors_allowed_origins="*", ping_interval=config.WEBSOCKET_PING_INTERVAL, async_mode='gevent', json=OrjsonWrapper)
 
 # MQTT Configuration
 MQTT_BROKER = "test.mosquitto.org"
@@ -35,20 +78,149 @@ try:
     mongo_client = MongoClient(config.MONGO_URI)
     db = mongo_client[config.MONGO_DB_NAME]
     readings_collection = db['readings']
-    print(f"✅ MongoDB connected: {config.MONGO_DB_NAME}")
+    log.info("✅ MongoDB connected: %s", config.MONGO_DB_NAME)
 except Exception as e:
-    print(f"❌ MongoDB connection failed: {e}")
+    log.error("❌ MongoDB connection failed: %s", e)
     readings_collection = None
 
+# Index hint for /api/history, set once the index is known to exist
+_history_hint = None
+
+def _ensure_history_index():
+    """Create the newest-first timestamp index used by /api/history"""
+    global _history_hint
+    # Runs in the background: this is the first real round trip to MongoDB, and a
+    # server that is down (or an existing index under another name) must not hold up
+    # startup or disable persistence; the client reconnects lazily on its own
+    try:
+        readings_collection.create_index([('timestamp', DESCENDING)], name='ts_desc')
+        _history_hint = 'ts_desc'
+    except Exception as e:
+        log.warning("⚠️  Could not create the timestamp index: %s", e)
+
+if readings_collection is not None:
+    socketio.start_background_task(_ensure_history_index)
+
 # Load ML model
 MODEL_PATH = Path(__file__).parent / config.MODEL_PATH
+# Uncompressed models are memory-mapped; LZ4-compressed ones (the default from
+# train_model.py) are decompressed instead, which joblib would otherwise warn about
+warnings.filterwarnings("ignore", message='mmap_mode "r" is not compatible with compressed file')
 try:
-    model = joblib.load(MODEL_PATH)
-    print(f"✅ ML Model loaded: {MODEL_PATH.name}")
+    model = joblib.load(MODEL_PATH, mmap_mode='r')
+    log.info("✅ ML Model loaded: %s", MODEL_PATH.name)
 except Exception as e:
-    print(f"❌ Error loading model: {e}")
+    log.error("❌ Error loading model: %s", e)
     model = None
 
+# Decided once at startup; the model is never reloaded
+MODEL_LOADED = model is not None
+
+# Compiled ONNX Runtime predictor (falls back to the sklearn model when unavailable)
+ONNX_PATH = Path(__file__).parent / config.ONNX_MODEL_PATH
+onnx_session = None
+if MODEL_LOADED and ort is not None:
+    try:
+        if not ONNX_PATH.exists() or ONNX_PATH.stat().st_mtime < MODEL_PATH.stat().st_mtime:
+            from skl2onnx import convert_sklearn
+            from skl2onnx.common.data_types import FloatTensorType
+            estimator = model.steps[-1][1] if hasattr(model, 'steps') else model
+            onx = convert_sklearn(
+                model,
+                initial_types=[('X', FloatTensorType([None, 6]))],
+                options={id(estimator): {'zipmap': False}}
+            )
+            ONNX_PATH.write_bytes(onx.SerializeToString())
+            log.info("✅ ONNX model exported: %s", ONNX_PATH.name)
+        sess_options = ort.SessionOptions()
+        sess_options.intra_op_num_threads = 1
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        onnx_session = ort.InferenceSession(
+            str(ONNX_PATH), sess_options=sess_options, providers=['CPUExecutionProvider']
+        )
+        log.info("✅ ONNX Runtime predictor loaded: %s", ONNX_PATH.name)
+    except Exception as e:
+        log.warning("⚠️  ONNX Runtime unavailable, using sklearn model: %s", e)
+        onnx_session = None
+
+# Model feature order, fallback values and cache quantization steps (1/step)
+_KEYS = ('pH', 'Sulphate', 'Hardness', 'Conductivity', 'TDS', 'Turbidity')
+_DEFAULTS = (7.0, 250.0, 165.0, 500.0, 600.0, 3.0)
+_QUANT = (20, 1, 1, 1, 1, 10)
+
+_REQUIRED = frozenset(_KEYS)
+
+def _coerce(data):
+    """
+    Cast the model parameters present in a reading to float once.
+    Returns (values, invalid): values holds the numeric parameters, invalid
+    names the parameters that are present but not numeric. Missing
+    parameters appear in neither.
+    """
+    if _REQUIRED.issubset(data):
+        # Complete reading (the normal case): index directly
+        try:
+            return {k: float(data[k]) for k in _KEYS}, ()
+        except (TypeError, ValueError):
+            pass
+    values = {}
+    invalid = []
+    for k in _KEYS:
+        if k in data:
+            try:
+                values[k] = float(data[k])
+            except (TypeError, ValueError):
+                invalid.append(k)
+    return values, tuple(invalid)
+
+# Prediction micro-batcher: requests are queued and scored together in one model call
+_predict_queue = queue.Queue()
+_batch_buf = np.empty((config.PREDICT_BATCH_MAX, 6), dtype=np.float32)
+
+def _prediction_worker():
+    """Score queued prediction requests, taking whatever has queued up as one batch"""
+    while True:
+        # Never wait for more work: a lone request (the usual MQTT case, since
+        # on_message blocks on its result) is scored immediately
+        items = [_predict_queue.get()]
+        while len(items) < config.PREDICT_BATCH_MAX:
+            try:
+                items.append(_predict_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        # Rows are plain float tuples written straight into the preallocated buffer
+        X = _batch_buf[:len(items)]
+        for i, (row, _, _) in enumerate(items):
+            X[i] = row
+
+        try:
+            if onnx_session is not None:
+                probs = onnx_session.run(None, {'X': X})[1]
+            else:
+                probs = model.predict_proba(X)
+            # Class labels are 0/1, so the most probable column is the prediction
+            preds = probs.argmax(axis=1)
+            for i, (_, _, slot) in enumerate(items):
+                pred = int(preds[i])
+                slot.append((pred, float(probs[i, pred]) * 100.0))
+        except Exception as e:
+            log.error("❌ Prediction error: %s", e)
+        finally:
+            for _, event, _ in items:
+                event.set()
+
+if MODEL_LOADED:
+    socketio.start_background_task(_prediction_worker)
+
+def _log_flusher():
+    """Write out buffered log records every LOG_FLUSH_INTERVAL"""
+    while True:
+        time.sleep(config.LOG_FLUSH_INTERVAL)
+        _log_buffer.flush()
+
+socketio.start_background_task(_log_flusher)
+
 # Initialize email service
 email_service = None
 if config.validate_config():
@@ -60,140 +232,220 @@ if config.validate_config():
             sender_password=config.SENDER_PASSWORD,
             recipient_email=config.RECIPIENT_EMAIL
         )
-        print(f"✅ Email service initialized (recipient: {config.RECIPIENT_EMAIL})")
+        log.info("✅ Email service initialized (recipient: %s)", config.RECIPIENT_EMAIL)
     except Exception as e:
-        print(f"⚠️  Email service initialization failed: {e}")
+        log.warning("⚠️  Email service initialization failed: %s", e)
 else:
-    print("⚠️  Email alerts disabled - configure config.py")
+    log.warning("⚠️  Email alerts disabled - configure config.py")
+
+# Pending MongoDB inserts, flushed in batches by a background thread
+_pending_inserts = collections.deque()
+_pending_lock = threading.Lock()
+_flush_wakeup = threading.Event()
 
-# Consecutive contamination tracking
-consecutive_contamination_count = 0
-last_prediction = None
-email_alert_sent = False
+# Serialized /api/history response shared by all dashboards: (monotonic time, JSON bytes)
+_history_cache = (0.0, None)
 
-def predict_water_quality(data):
+# Consecutive contamination tracking, shared by the MQTT handler and request handlers
+@dataclass(slots=True)
+class State:
+    consec: int = 0
+    last_pred: int | None = None
+    alert_sent: bool = False
+    # An alert email is queued and its outcome has not come back yet
+    alert_pending: bool = False
+
+_state = State()
+_state_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=config.PREDICT_CACHE_SIZE)
+def _predict_cached(ph_q, sulphate_q, hardness_q, conductivity_q, tds_q, turbidity_q):
+    """
+    Score one quantized reading through the batch worker.
+    Raises on failure so that errors are never cached.
     """
-    Predict water quality using ML model
+    features = (
+        ph_q / _QUANT[0],
+        sulphate_q / _QUANT[1],
+        hardness_q / _QUANT[2],
+        conductivity_q / _QUANT[3],
+        tds_q / _QUANT[4],
+        turbidity_q / _QUANT[5]
+    )
+    
+    # Hand the row to the batch worker and wait for its result
+    done = threading.Event()
+    result = []
+    _predict_queue.put((features, done, result))
+    done.wait()
+    
+    if not result:
+        raise RuntimeError("batch prediction failed")
+    return result[0]
+
+def predict_water_quality(values):
+    """
+    Predict water quality using ML model from coerced readings (see _coerce)
+    Missing parameters are filled with typical values; readings with
+    non-numeric parameters must not be passed in.
+    Readings are quantized (pH to 0.05, Turbidity to 0.1, others to 1)
+    so that repeated readings are answered from the cache.
     Returns: prediction (0=Unsafe, 1=Safe), confidence
     """
-    if model is None:
+    if not MODEL_LOADED:
         return 0, 0.0
     
     try:
-        features = np.array([[
-            float(data.get('pH', 7.0)),
-            float(data.get('Sulphate', 250)),
-            float(data.get('Hardness', 165)),
-            float(data.get('Conductivity', 500)),
-            float(data.get('TDS', 600)),
-            float(data.get('Turbidity', 3.0))
-        ]])
-        
-        prediction = model.predict(features)[0]
-        probabilities = model.predict_proba(features)[0]
-        confidence = float(max(probabilities) * 100)
-        
-        return int(prediction), confidence
+        key = [0] * 6
+        for i, (k, d, q) in enumerate(zip(_KEYS, _DEFAULTS, _QUANT)):
+            key[i] = round(values.get(k, d) * q)
+        return _predict_cached(*key)
     except Exception as e:
-        print(f"❌ Prediction error: {e}")
+        log.error("❌ Prediction error: %s", e)
         return 0, 0.0
 
-def check_thresholds(data):
+# Safe-range table in model feature order, for vectorized threshold checks
+_MIN = np.array([config.SAFE_RANGES[p]['min'] for p in _KEYS], dtype=np.float64)
+_MAX = np.array([config.SAFE_RANGES[p]['max'] for p in _KEYS], dtype=np.float64)
+
+def check_thresholds(values):
     """
-    Check if parameters are within safe ranges
+    Check if coerced parameters (see _coerce) are within safe ranges
+    Only parameters present in the reading are reported.
     """
+    present = [i for i, p in enumerate(_KEYS) if p in values]
+    vals = np.fromiter((values[_KEYS[i]] for i in present), dtype=np.float64, count=len(present))
+    safe = (vals >= _MIN[present]) & (vals <= _MAX[present])
+    
     results = {}
-    for param, value in data.items():
-        if param in config.SAFE_RANGES and param != 'timestamp':
-            safe_min = config.SAFE_RANGES[param]['min']
-            safe_max = config.SAFE_RANGES[param]['max']
-            try:
-                val = float(value)
-                is_safe = safe_min <= val <= safe_max
-                results[param] = {
-                    'value': val,
-                    'safe_min': safe_min,
-                    'safe_max': safe_max,
-                    'is_safe': is_safe
-                }
-            except:
-                pass
+    for i, val, is_safe in zip(present, vals.tolist(), safe.tolist()):
+        param = _KEYS[i]
+        results[param] = {
+            'value': val,
+            'safe_min': config.SAFE_RANGES[param]['min'],
+            'safe_max': config.SAFE_RANGES[param]['max'],
+            'is_safe': is_safe
+        }
     return results
 
-def handle_consecutive_contamination(sensor_data, prediction_value):
+def handle_consecutive_contamination(sensor_data, prediction_value, threshold_results):
     """
     Track consecutive contamination and send email alert if threshold reached
+    Returns: (consecutive count, email alert sent) snapshot
     """
-    global consecutive_contamination_count, last_prediction, email_alert_sent
+    send_alert = False
+    with _state_lock:
+        if prediction_value == 0:  # Unsafe/Contaminated
+            _state.consec += 1
+            # Claim the alert while holding the lock so it is only sent once
+            if (_state.consec >= config.CONSECUTIVE_CONTAMINATION_THRESHOLD 
+                and not _state.alert_sent 
+                and not _state.alert_pending
+                and email_service is not None):
+                _state.alert_pending = send_alert = True
+        else:  # Safe
+            previous_count = _state.consec
+            # Reset counter when safe reading detected
+            _state.consec = 0
+            _state.alert_sent = False
+            _state.alert_pending = False
+        _state.last_pred = prediction_value
+        consec, alert_sent = _state.consec, _state.alert_sent
     
-    if prediction_value == 0:  # Unsafe/Contaminated
-        consecutive_contamination_count += 1
-        print(f"⚠️  Consecutive contamination count: {consecutive_contamination_count}")
+    if prediction_value == 0:
+        log.debug("⚠️  Consecutive contamination count: %d", consec)
+    elif previous_count > 0:
+        log.info("✅ Safe reading detected. Resetting counter (was %d)", previous_count)
+    
+    if send_alert:
+        log.warning("🚨 ALERT: %d consecutive contaminations detected!", config.CONSECUTIVE_CONTAMINATION_THRESHOLD)
         
-        # Check if threshold reached and email not yet sent
-        if (consecutive_contamination_count >= config.CONSECUTIVE_CONTAMINATION_THRESHOLD 
-            and not email_alert_sent 
-            and email_service is not None):
-            
-            print(f"🚨 ALERT: {config.CONSECUTIVE_CONTAMINATION_THRESHOLD} consecutive contaminations detected!")
-            
-            # Send email alert
-            success = email_service.send_contamination_alert(
-                sensor_data, 
-                consecutive_contamination_count
-            )
-            
-            if success:
-                email_alert_sent = True
-                # Broadcast alert to all clients
-                socketio.emit('email_alert_sent', {
-                    'consecutive_count': consecutive_contamination_count,
-                    'timestamp': datetime.now().isoformat()
-                })
-    else:  # Safe
-        # Reset counter when safe reading detected
-        if consecutive_contamination_count > 0:
-            print(f"✅ Safe reading detected. Resetting counter (was {consecutive_contamination_count})")
-        consecutive_contamination_count = 0
-        email_alert_sent = False
+        # Send email alert; the outcome arrives later from the sender thread
+        email_service.send_contamination_alert(
+            sensor_data, 
+            consec,
+            threshold_results,
+            on_result=functools.partial(_alert_result, consec)
+        )
     
-    last_prediction = prediction_value
+    return consec, alert_sent
+
+def _alert_result(consec, success):
+    """Record the outcome of a queued alert email (called from the email sender thread)"""
+    with _state_lock:
+        # A safe reading in the meantime has already cleared the claim
+        if not _state.alert_pending:
+            return
+        _state.alert_pending = False
+        # On failure the next contaminated reading tries again
+        _state.alert_sent = success
     
-    return consecutive_contamination_count
+    if success:
+        # Broadcast alert to all clients
+        socketio.emit('email_alert_sent', {
+            'consecutive_count': consec,
+            'timestamp': _now()
+        })
+
+# (millisecond, datetime) of the last _now() call, replaced as a single tuple
+_now_cache = (0, None)
+
+def _now():
+    """datetime.now() cached per wall-clock millisecond, so bursts share one object"""
+    global _now_cache
+    ms = time.time_ns() // 1_000_000
+    cached_ms, cached_now = _now_cache
+    if ms != cached_ms:
+        cached_now = datetime.fromtimestamp(ms / 1000)
+        _now_cache = (ms, cached_now)
+    return cached_now
+
+def _to_datetime(timestamp):
+    """Parse a reading timestamp into a native datetime, falling back to now"""
+    if isinstance(timestamp, datetime):
+        return timestamp
+    try:
+        return datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return _now()
 
 def process_sensor_data(sensor_data, source="MQTT"):
     """Common logic to process sensor data and broadcast updates"""
     try:
         # Add timestamp if not present
         if 'timestamp' not in sensor_data:
-            sensor_data['timestamp'] = datetime.now().isoformat()
+            sensor_data['timestamp'] = _now()
         
-        # Make prediction
-        prediction, confidence = predict_water_quality(sensor_data)
-        threshold_results = check_thresholds(sensor_data)
+        # Cast the parameters once and share them below
+        values, invalid = _coerce(sensor_data)
+        
+        # Make prediction; a garbled sensor value must never be scored with the
+        # typical defaults, so such readings count as unsafe with no confidence
+        if invalid:
+            log.warning("⚠️  Non-numeric %s in reading, treating it as unsafe", ', '.join(invalid))
+            prediction, confidence = 0, 0.0
+        else:
+            prediction, confidence = predict_water_quality(values)
+        threshold_results = check_thresholds(values)
         
         # Track consecutive contamination
-        consecutive_count = handle_consecutive_contamination(sensor_data, prediction)
+        consecutive_count, alert_sent = handle_consecutive_contamination(sensor_data, prediction, threshold_results)
         
         # Save to MongoDB
         if readings_collection is not None:
             try:
                 document = {
-                    'timestamp': sensor_data['timestamp'],
-                    'pH': float(sensor_data.get('pH', 0)),
-                    'Sulphate': float(sensor_data.get('Sulphate', 0)),
-                    'Hardness': float(sensor_data.get('Hardness', 0)),
-                    'Conductivity': float(sensor_data.get('Conductivity', 0)),
-                    'TDS': float(sensor_data.get('TDS', 0)),
-                    'Turbidity': float(sensor_data.get('Turbidity', 0)),
+                    'timestamp': _to_datetime(sensor_data['timestamp']),
+                    **{k: values.get(k, 0.0) for k in _KEYS},
                     'prediction': int(prediction),
                     'confidence': float(confidence),
                     'source': source
                 }
-                readings_collection.insert_one(document)
-                # print("💾 Data saved to MongoDB")
+                _pending_inserts.append(document)
+                if len(_pending_inserts) >= config.INSERT_BATCH_SIZE:
+                    _flush_wakeup.set()
             except Exception as e:
-                print(f"❌ Failed to save to MongoDB: {e}")
+                log.error("❌ Failed to queue MongoDB insert: %s", e)
 
         # Prepare response
         response = {
@@ -204,49 +456,88 @@ def process_sensor_data(sensor_data, source="MQTT"):
             'led_status': 'green' if prediction == 1 else 'red',
             'thresholds': threshold_results,
             'consecutive_count': consecutive_count,
-            'email_alert_sent': email_alert_sent,
+            'email_alert_sent': alert_sent,
             'timestamp': sensor_data.get('timestamp', ''),
             'source': source
         }
         
-        # Broadcast to all clients
-        socketio.emit('prediction_update', response)
+        # Broadcast to all clients without waiting on slow sockets
+        socketio.start_background_task(socketio.emit, 'prediction_update', response)
         
         status_icon = "✅" if prediction == 1 else "⚠️"
-        print(f"{status_icon} [{source}] Prediction: {response['prediction']} ({confidence:.2f}% confidence)")
+        log.debug("%s [%s] Prediction: %s (%.2f%% confidence)", status_icon, source, response['prediction'], confidence)
         
     except Exception as e:
-        print(f"❌ Error processing data: {e}")
+        log.error("❌ Error processing data: %s", e)
+
+def flush_pending_inserts():
+    """Write all queued readings to MongoDB in a single batch"""
+    if readings_collection is None:
+        return
+    batch = []
+    with _pending_lock:
+        while _pending_inserts:
+            batch.append(_pending_inserts.popleft())
+    if not batch:
+        return
+    try:
+        readings_collection.insert_many(batch, ordered=False)
+    except Exception as e:
+        log.error("❌ Failed to save %d readings to MongoDB: %s", len(batch), e)
+    
+    # New readings are in, so the next history request should see them
+    global _history_cache
+    _history_cache = (0.0, None)
+
+def _insert_flusher():
+    """Flush queued readings every INSERT_FLUSH_INTERVAL or when the batch fills up"""
+    while True:
+        _flush_wakeup.wait(config.INSERT_FLUSH_INTERVAL)
+        _flush_wakeup.clear()
+        flush_pending_inserts()
+
+# Flush whatever is left when the server shuts down
+atexit.register(flush_pending_inserts)
 
 # MQTT Callbacks
+# Connection state kept by the MQTT callbacks so /api/status never touches the client lock
+_mqtt_connected = threading.Event()
+
 def on_connect(client, userdata, flags, rc):
-    print(f"📡 MQTT Connected with result code {rc}")
+    log.info("📡 MQTT Connected with result code %s", rc)
+    if rc == 0:
+        _mqtt_connected.set()
     client.subscribe(MQTT_TOPIC)
-    print(f"👂 Subscribed to topic: {MQTT_TOPIC}")
+    log.info("👂 Subscribed to topic: %s", MQTT_TOPIC)
+
+def on_disconnect(client, userdata, rc):
+    _mqtt_connected.clear()
+    log.info("📡 MQTT Disconnected with result code %s", rc)
 
 def on_message(client, userdata, msg):
     try:
-        payload = msg.payload.decode()
-        data = json.loads(payload)
-        print(f"📥 MQTT Data: {data}")
+        data = orjson.loads(msg.payload)
+        log.debug("📥 MQTT Data: %s", data)
         process_sensor_data(data, source="MQTT")
-    except json.JSONDecodeError:
-        print(f"⚠️ Invalid JSON from MQTT: {msg.payload}")
+    except orjson.JSONDecodeError:
+        log.warning("⚠️ Invalid JSON from MQTT: %r", msg.payload)
     except Exception as e:
-        print(f"❌ MQTT Error: {e}")
+        log.error("❌ MQTT Error: %s", e)
 
 # Start MQTT Client
 mqtt_client = mqtt.Client(transport="websockets")
 mqtt_client.on_connect = on_connect
+mqtt_client.on_disconnect = on_disconnect
 mqtt_client.on_message = on_message
 
 def start_mqtt():
+    socketio.start_background_task(_insert_flusher)
     try:
-        print(f"🔌 Connecting to MQTT Broker: {MQTT_BROKER} (WebSockets)...")
+        log.info("🔌 Connecting to MQTT Broker: %s (WebSockets)...", MQTT_BROKER)
         mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
         mqtt_client.loop_start()
     except Exception as e:
-        print(f"❌ Failed to connect to MQTT broker: {e}")
+        log.error("❌ Failed to connect to MQTT broker: %s", e)
 
 # Routes
 @app.route('/')
@@ -272,27 +563,40 @@ def api_predict():
 @app.route('/api/status')
 def api_status():
     """Get system status"""
+    with _state_lock:
+        consec, alert_sent = _state.consec, _state.alert_sent
     return jsonify({
-        'model_loaded': model is not None,
+        'model_loaded': MODEL_LOADED,
         'email_configured': email_service is not None,
-        'consecutive_count': consecutive_contamination_count,
-        'email_alert_sent': email_alert_sent,
+        'consecutive_count': consec,
+        'email_alert_sent': alert_sent,
         'alert_threshold': config.CONSECUTIVE_CONTAMINATION_THRESHOLD,
-        'mqtt_connected': mqtt_client.is_connected()
+        'mqtt_connected': _mqtt_connected.is_set(),
+        'prediction_cache': _predict_cached.cache_info()._asdict()
     })
 
 @app.route('/api/history')
 def api_history():
-    """Get historical data for charts"""
+    """Get historical data for charts (cached for HISTORY_CACHE_TTL seconds)"""
+    global _history_cache
     try:
         if readings_collection is None:
             return jsonify([])
         
+        cached_at, body = _history_cache
+        if body is not None and time.monotonic() - cached_at < config.HISTORY_CACHE_TTL:
+            return Response(body, mimetype='application/json')
+        
         # Get last 100 readings, sorted by timestamp descending
-        cursor = readings_collection.find({}, {'_id': 0}).sort('timestamp', -1).limit(100)
+        cursor = readings_collection.find({}, {'_id': 0}).sort('timestamp', DESCENDING).limit(100)
+        if _history_hint is not None:
+            cursor = cursor.hint(_history_hint)
         data = list(cursor)
-        # Return in ascending order for charts
-        return jsonify(data[::-1])
+        # Return in ascending order for charts; orjson writes datetimes as ISO strings
+        data.reverse()
+        body = orjson.dumps(data)
+        _history_cache = (time.monotonic(), body)
+        return Response(body, mimetype='application/json')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -300,17 +604,19 @@ def api_history():
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
-    print('✅ Client connected - Emitting status...')
+    log.info('✅ Client connected - Emitting status...')
+    with _state_lock:
+        consec, alert_sent = _state.consec, _state.alert_sent
     emit('connection_status', {
         'status': 'connected',
-        'consecutive_count': consecutive_contamination_count,
-        'email_alert_sent': email_alert_sent
+        'consecutive_count': consec,
+        'email_alert_sent': alert_sent
     })
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
-    print('❌ Client disconnected')
+    log.info('❌ Client disconnected')
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -329,6 +635,5 @@ if __name__ == '__main__':
         app, 
         debug=config.DEBUG_MODE, 
         host=config.FLASK_HOST, 
-        port=config.FLASK_PORT, 
-        allow_unsafe_werkzeug=True
+        port=config.FLASK_PORT
     )
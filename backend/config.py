@@ -48,12 +48,23 @@ DEBUG_MODE = True
 SERIAL_PORT = "COM3"  # Adjust based on your system
 SERIAL_BAUD_RATE = 115200
 
+# Logging Configuration
+LOG_LEVEL = "INFO"            # Set to "DEBUG" to log every reading and prediction
+LOG_BUFFER_CAPACITY = 1024    # Records buffered before they are written out
+LOG_FLUSH_LEVEL = "WARNING"   # Records at this level or above flush the buffer at once
+LOG_FLUSH_INTERVAL = 1.0      # Seconds between flushes of lower-level buffered records
+
 # WebSocket Configuration
 WEBSOCKET_PING_INTERVAL = 25
 WEBSOCKET_PING_TIMEOUT = 60
 
 # Model Path
 MODEL_PATH = "tamilnadu_water_model_v4.joblib"
+ONNX_MODEL_PATH = "tamilnadu_water_model_v4.onnx"  # Exported from MODEL_PATH on startup
+
+# Prediction Batching
+PREDICT_BATCH_MAX = 64        # Maximum readings scored in one model call
+PREDICT_CACHE_SIZE = 4096     # Quantized readings kept in the prediction cache
 
 # Wokwi Configuration
 # Get your project ID from the Wokwi project URL: https://wokwi.com/projects/<PROJECT_ID>
@@ -111,6 +122,9 @@ TO CONFIGURE EMAIL ALERTS:
 # MongoDB Configuration
 MONGO_URI = "mongodb://localhost:27017/"
 MONGO_DB_NAME = "water_quality_db"
+INSERT_BATCH_SIZE = 500       # Flush early once this many readings are queued
+INSERT_FLUSH_INTERVAL = 1.0   # Seconds between batched inserts
+HISTORY_CACHE_TTL = 1.0       # Seconds /api/history responses are reused
 
 # Validation
 def validate_config():
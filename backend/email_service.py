@@ -4,227 +4,164 @@ Sends alerts when water is contaminated for 5 consecutive readings
 """
 
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import logging
+import queue
+import threading
+from email.header import Header
 from datetime import datetime
+from pathlib import Path
+from string import Template
 import os
 
+log = logging.getLogger(__name__)
+
+TEMPLATE_PATH = Path(__file__).parent / 'templates' / 'email_alert.html'
+
 class EmailAlertService:
-    def __init__(self, smtp_server, smtp_port, sender_email, sender_password, recipient_email):
+    # (sensor parameter, table label, unit suffix) in email table order
+    PARAMETERS = (
+        ('pH', 'pH Level', ''),
+        ('Sulphate', 'Sulphate', ' mg/L'),
+        ('Hardness', 'Hardness', ' mg/L'),
+        ('Conductivity', 'Conductivity', ' µS/cm'),
+        ('TDS', 'TDS', ' mg/L'),
+        ('Turbidity', 'Turbidity', ' NTU')
+    )
+    
+    ROW_TEMPLATE = (
+        "                    <tr>\n"
+        "                        <td>{label}</td>\n"
+        "                        <td>{value}{unit}</td>\n"
+        "                        <td>{safe_min} - {safe_max}{unit}</td>\n"
+        "                        <td class=\"{css}\">\n"
+        "                            {status}\n"
+        "                        </td>\n"
+        "                    </tr>"
+    )
+    
+    def __init__(self, smtp_server, smtp_port, sender_email, sender_password, recipient_email,
+                 template_path=TEMPLATE_PATH):
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
         self.sender_email = sender_email
         self.sender_password = sender_password
         self.recipient_email = recipient_email
         
-    def send_contamination_alert(self, sensor_data, consecutive_count):
+        # Compile the HTML template once instead of rebuilding it per alert
+        self._tmpl = Template(Path(template_path).read_text(encoding='utf-8'))
+        
+        # Fixed message headers, encoded once; each alert only appends its HTML body
+        subject = Header('⚠️ URGENT: Water Contamination Alert - Tamil Nadu Water Quality Monitor', 'utf-8').encode(linesep='\r\n')
+        self._headers = (
+            f"From: {self.sender_email}\r\n"
+            f"To: {self.recipient_email}\r\n"
+            f"Subject: {subject}\r\n"
+            "MIME-Version: 1.0\r\n"
+            "Content-Type: text/html; charset=utf-8\r\n"
+            "Content-Transfer-Encoding: 8bit\r\n"
+            "\r\n"
+        )
+        
+        # Alerts are sent from a background thread over one long-lived SMTP connection
+        self._smtp = None
+        self._smtp_lock = threading.Lock()
+        self._q = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        
+    def send_contamination_alert(self, sensor_data, consecutive_count, thresholds, on_result=None):
         """
-        Send email alert for water contamination
+        Queue an email alert for water contamination and return immediately
+        thresholds: per-parameter results from check_thresholds()
+        on_result: optional callable, called from the sender thread with
+                   True/False once the email has been sent or has failed
+        """
+        self._q.put_nowait((sensor_data, consecutive_count, thresholds, on_result))
+    
+    def _run(self):
+        """Sender thread: deliver queued alerts one at a time"""
+        while True:
+            sensor_data, consecutive_count, thresholds, on_result = self._q.get()
+            success = self._send_alert(sensor_data, consecutive_count, thresholds)
+            if on_result is not None:
+                try:
+                    on_result(success)
+                except Exception as e:
+                    log.error("❌ Alert result callback failed: %s", e)
+    
+    def _send_alert(self, sensor_data, consecutive_count, thresholds):
+        """
+        Build and send one contamination alert email
         """
         try:
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = '⚠️ URGENT: Water Contamination Alert - Tamil Nadu Water Quality Monitor'
-            msg['From'] = self.sender_email
-            msg['To'] = self.recipient_email
-            
             # Create HTML email body
-            html_body = self._create_html_email(sensor_data, consecutive_count)
+            html_body = self._create_html_email(thresholds, consecutive_count, sensor_data.get('timestamp'))
             
-            # Attach HTML body
-            html_part = MIMEText(html_body, 'html')
-            msg.attach(html_part)
+            # Raw RFC 822 message: precomputed headers + CRLF-terminated body
+            payload = (self._headers + html_body.replace('\n', '\r\n')).encode('utf-8')
             
-            # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.sender_password)
-                server.send_message(msg)
+            # Send email, reconnecting once if the server dropped the connection
+            with self._smtp_lock:
+                try:
+                    self._connection().sendmail(self.sender_email, [self.recipient_email], payload)
+                except smtplib.SMTPServerDisconnected:
+                    self._smtp = None
+                    self._connection().sendmail(self.sender_email, [self.recipient_email], payload)
             
-            print(f"✅ Alert email sent to {self.recipient_email}")
+            log.info("✅ Alert email sent to %s", self.recipient_email)
             return True
             
         except Exception as e:
-            print(f"❌ Failed to send email: {e}")
+            log.error("❌ Failed to send email: %s", e)
             return False
     
-    def _create_html_email(self, sensor_data, consecutive_count):
+    def _connection(self):
         """
-        Create HTML email template
+        Return the persistent SMTP connection, reconnecting when a NOOP
+        shows it has gone stale. Call with self._smtp_lock held.
         """
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            try:
+                self._smtp.close()
+            except Exception:
+                pass
+            self._smtp = None
         
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    background-color: #f4f4f4;
-                    margin: 0;
-                    padding: 20px;
-                }}
-                .container {{
-                    max-width: 600px;
-                    margin: 0 auto;
-                    background-color: white;
-                    border-radius: 10px;
-                    overflow: hidden;
-                    box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                }}
-                .header {{
-                    background: linear-gradient(135deg, #ee0979 0%, #ff6a00 100%);
-                    color: white;
-                    padding: 30px;
-                    text-align: center;
-                }}
-                .header h1 {{
-                    margin: 0;
-                    font-size: 24px;
-                }}
-                .alert-icon {{
-                    font-size: 48px;
-                    margin-bottom: 10px;
-                }}
-                .content {{
-                    padding: 30px;
-                }}
-                .alert-box {{
-                    background-color: #fff3cd;
-                    border-left: 4px solid #ff6a00;
-                    padding: 15px;
-                    margin-bottom: 20px;
-                }}
-                .sensor-table {{
-                    width: 100%;
-                    border-collapse: collapse;
-                    margin: 20px 0;
-                }}
-                .sensor-table th {{
-                    background-color: #f8f9fa;
-                    padding: 12px;
-                    text-align: left;
-                    border-bottom: 2px solid #dee2e6;
-                }}
-                .sensor-table td {{
-                    padding: 10px 12px;
-                    border-bottom: 1px solid #dee2e6;
-                }}
-                .unsafe {{
-                    color: #dc3545;
-                    font-weight: bold;
-                }}
-                .safe {{
-                    color: #28a745;
-                }}
-                .footer {{
-                    background-color: #f8f9fa;
-                    padding: 20px;
-                    text-align: center;
-                    font-size: 12px;
-                    color: #6c757d;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <div class="alert-icon">⚠️</div>
-                    <h1>Water Contamination Alert</h1>
-                    <p>Tamil Nadu Water Quality Monitoring System</p>
-                </div>
-                
-                <div class="content">
-                    <div class="alert-box">
-                        <strong>URGENT ALERT:</strong> Water has been detected as <strong>CONTAMINATED</strong> 
-                        for <strong>{consecutive_count} consecutive readings</strong>.
-                    </div>
-                    
-                    <p><strong>Detection Time:</strong> {timestamp}</p>
-                    
-                    <h3>Current Sensor Readings:</h3>
-                    <table class="sensor-table">
-                        <thead>
-                            <tr>
-                                <th>Parameter</th>
-                                <th>Current Value</th>
-                                <th>Safe Range</th>
-                                <th>Status</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            <tr>
-                                <td>pH Level</td>
-                                <td>{sensor_data.get('pH', 'N/A')}</td>
-                                <td>6.5 - 8.5</td>
-                                <td class="{'safe' if 6.5 <= sensor_data.get('pH', 0) <= 8.5 else 'unsafe'}">
-                                    {'✓ Safe' if 6.5 <= sensor_data.get('pH', 0) <= 8.5 else '✗ Unsafe'}
-                                </td>
-                            </tr>
-                            <tr>
-                                <td>Sulphate</td>
-                                <td>{sensor_data.get('Sulphate', 'N/A')} mg/L</td>
-                                <td>100 - 400 mg/L</td>
-                                <td class="{'safe' if 100 <= sensor_data.get('Sulphate', 0) <= 400 else 'unsafe'}">
-                                    {'✓ Safe' if 100 <= sensor_data.get('Sulphate', 0) <= 400 else '✗ Unsafe'}
-                                </td>
-                            </tr>
-                            <tr>
-                                <td>Hardness</td>
-                                <td>{sensor_data.get('Hardness', 'N/A')} mg/L</td>
-                                <td>80 - 250 mg/L</td>
-                                <td class="{'safe' if 80 <= sensor_data.get('Hardness', 0) <= 250 else 'unsafe'}">
-                                    {'✓ Safe' if 80 <= sensor_data.get('Hardness', 0) <= 250 else '✗ Unsafe'}
-                                </td>
-                            </tr>
-                            <tr>
-                                <td>Conductivity</td>
-                                <td>{sensor_data.get('Conductivity', 'N/A')} µS/cm</td>
-                                <td>200 - 800 µS/cm</td>
-                                <td class="{'safe' if 200 <= sensor_data.get('Conductivity', 0) <= 800 else 'unsafe'}">
-                                    {'✓ Safe' if 200 <= sensor_data.get('Conductivity', 0) <= 800 else '✗ Unsafe'}
-                                </td>
-                            </tr>
-                            <tr>
-                                <td>TDS</td>
-                                <td>{sensor_data.get('TDS', 'N/A')} mg/L</td>
-                                <td>200 - 1000 mg/L</td>
-                                <td class="{'safe' if 200 <= sensor_data.get('TDS', 0) <= 1000 else 'unsafe'}">
-                                    {'✓ Safe' if 200 <= sensor_data.get('TDS', 0) <= 1000 else '✗ Unsafe'}
-                                </td>
-                            </tr>
-                            <tr>
-                                <td>Turbidity</td>
-                                <td>{sensor_data.get('Turbidity', 'N/A')} NTU</td>
-                                <td>1.5 - 5.0 NTU</td>
-                                <td class="{'safe' if 1.5 <= sensor_data.get('Turbidity', 0) <= 5.0 else 'unsafe'}">
-                                    {'✓ Safe' if 1.5 <= sensor_data.get('Turbidity', 0) <= 5.0 else '✗ Unsafe'}
-                                </td>
-                            </tr>
-                        </tbody>
-                    </table>
-                    
-                    <h3>Recommended Actions:</h3>
-                    <ul>
-                        <li>Immediately stop water consumption from this source</li>
-                        <li>Conduct detailed water quality testing</li>
-                        <li>Identify and address contamination source</li>
-                        <li>Notify local water authorities</li>
-                        <li>Consider alternative water sources</li>
-                    </ul>
-                </div>
-                
-                <div class="footer">
-                    <p>This is an automated alert from Tamil Nadu Water Quality Monitoring System</p>
-                    <p>For support, please contact your system administrator</p>
-                </div>
-            </div>
-        </body>
-        </html>
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        server.starttls()
+        server.login(self.sender_email, self.sender_password)
+        self._smtp = server
+        return self._smtp
+    
+    def _create_html_email(self, thresholds, consecutive_count, detected_at=None):
+        """
+        Fill the precompiled HTML template from check_thresholds() results
         """
+        rows = '\n'.join(
+            self.ROW_TEMPLATE.format(
+                label=label,
+                value=result['value'],
+                unit=unit,
+                safe_min=result['safe_min'],
+                safe_max=result['safe_max'],
+                css='safe' if result['is_safe'] else 'unsafe',
+                status='✓ Safe' if result['is_safe'] else '✗ Unsafe'
+            )
+            for param, label, unit in self.PARAMETERS
+            if (result := thresholds.get(param)) is not None
+        )
         
-        return html
+        fields = {
+            'timestamp': (detected_at if isinstance(detected_at, datetime) else datetime.now()).strftime("%Y-%m-%d %H:%M:%S"),
+            'consecutive_count': consecutive_count,
+            'rows': rows
+        }
+        return self._tmpl.substitute(fields)
 
 # Test function
 if __name__ == "__main__":